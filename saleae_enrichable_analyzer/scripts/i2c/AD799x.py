@@ -1,6 +1,7 @@
+import functools
 import logging
 import sys
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
 
 from saleae_enrichable_analyzer import Channel
 
@@ -10,14 +11,103 @@ from .base import I2CAnalyzer
 logger = logging.getLogger(__name__)
 
 
+def _adc_channel(frame1: int) -> int:
+    """ Returns the ADC channel in use for a returned measurement.
+
+    Uses READ frame #1 (zero-indexed)
+    """
+    return (frame1 >> 4) & 0b11
+
+
+def _adc_value(
+    frame1: int,
+    frame2: int,
+    msb_shift: int,
+    lsb_shift: int,
+) -> int:
+    """ Returns the ADC value for a measurement.
+
+    Uses READ frames #1 and #2 (zero-indexed)
+    """
+    # The AD799x series left-justifies their ADC results,
+    # so the second frame's rightmost bits may be empty
+    # on devices with lesser capabilities.  The below two
+    # shifts shift the contents of the first frame to the
+    # left and the second to the right such that when combined
+    # the rightmost bit provided by the ADC (in the second frame) is
+    # in the 1s position, and the rightmost bit of the first frame
+    # is one bit to the left of the leftmost bit of the second.
+    return ((frame1 & 0b1111) << msb_shift) | (frame2 >> lsb_shift)
+
+
+def _decode_constants(
+    bits: int,
+    reference_voltage: Optional[float],
+) -> Tuple[int, int, Optional[float]]:
+    """ Returns the shifts and volts-per-LSB used for decoding ADC values.
+
+    The volts-per-LSB is None if no reference voltage is provided.
+    """
+    msb_shift = bits - 4
+    lsb_shift = 12 - bits
+    lsb_voltage = (
+        reference_voltage / (1 << bits) if reference_voltage else None
+    )
+
+    return msb_shift, lsb_shift, lsb_voltage
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_adc_value(value: int, lsb_voltage: float) -> Tuple[str, ...]:
+    # Captures tend to contain the same few ADC values over and over,
+    # so the formatted strings are cached per value.
+    voltage = value * lsb_voltage
+
+    return (
+        f"{voltage:.4f} V ({value})",
+        f"{voltage:.4f} V",
+        f"{voltage:.2f}",
+    )
+
+
 class AD7995Analyzer(I2CAnalyzer):
+    CHANNEL_NAMES = ('0', '1', '2', '3')
+    CHANNEL_BITS = (1 << 4, 1 << 5, 1 << 6, 1 << 7)
+
+    FEATURE_NAMES = (
+        ('External Reference', 'Ext Ref'),
+        ('SDA and SCL Filtering', 'Filter'),
+        ('Bit Trial Delay', 'Bit Trial'),
+        ('Sample Delay', 'Samp. Del.'),
+    )
+    FEATURE_BITS = (1 << 3, 1 << 2, 1 << 1, 1 << 0)
+    # All features but the external reference are enabled when their
+    # configuration bit is cleared.
+    FEATURE_ACTIVE_HIGH = (True, False, False, False)
+
+    WRITE_ADDRESS_LABELS = (
+        "Write to ADC Configuration",
+        "W to ADC",
+        "W",
+    )
+    READ_ADDRESS_LABELS = (
+        "Read ADC Value",
+        "R from ADC",
+        "R",
+    )
+
     def __init__(self, cli_args, *args, **kwargs):
         super(AD7995Analyzer, self).__init__(cli_args, *args, **kwargs)
 
-        self._address = cli_args.i2c_address
         self._bits = cli_args.bits
         self._reference_voltage = cli_args.reference_voltage
 
+        # These depend only upon the device's precision and reference
+        # voltage, so we can calculate them once rather than per-frame.
+        self._msb_shift, self._lsb_shift, self._lsb_voltage = (
+            _decode_constants(self._bits, self._reference_voltage)
+        )
+
     @classmethod
     def add_arguments(cls, parser):
         I2CAnalyzer.add_arguments(parser)
@@ -42,98 +132,126 @@ class AD7995Analyzer(I2CAnalyzer):
             default=None
         )
 
+    @classmethod
+    def bulk_decode(
+        cls,
+        frames: Iterable[Tuple[int, int]],
+        bits: int,
+        reference_voltage: Optional[float] = None,
+    ) -> List[Tuple[int, Optional[float]]]:
+        """ Decodes many ADC readings at once; for offline use.
+
+        Accepts pairs of READ frames #1 and #2 (zero-indexed) and returns
+        a (value, voltage) pair for each; voltage is None if no reference
+        voltage is provided.
+        """
+        msb_shift, lsb_shift, lsb_voltage = _decode_constants(
+            bits,
+            reference_voltage,
+        )
+
+        results = []
+        for frame1, frame2 in frames:
+            value = _adc_value(frame1, frame2, msb_shift, lsb_shift)
+            results.append((
+                value,
+                value * lsb_voltage if lsb_voltage is not None else None,
+            ))
+
+        return results
+
     def get_configuration_settings(self, value):
         """ Returns channels and features enabled in a configuration.
 
         Uses WRITE frame #1 (zero-indexed)
         """
-        ch3 = value & (1 << 7)
-        ch2 = value & (1 << 6)
-        ch1 = value & (1 << 5)
-        ch0 = value & (1 << 4)
-
-        channels = {
-            '0': ch0,
-            '1': ch1,
-            '2': ch2,
-            '3': ch3,
-        }
         channels_enabled = [
-            name for name, en in channels.items() if en
+            name for name, bit in zip(self.CHANNEL_NAMES, self.CHANNEL_BITS)
+            if value & bit
         ]
-
-        ref_sel = value & (1 << 3)
-        fltr = value & (1 << 2)
-        bit_trial = value & (1 << 1)
-        sample = value & (1 << 0)
-
-        features = {
-            ('External Reference', 'Ext Ref'): ref_sel,
-            ('SDA and SCL Filtering', 'Filter'): not fltr,
-            ('Bit Trial Delay', 'Bit Trial'): not bit_trial,
-            ('Sample Delay', 'Samp. Del.'): not sample,
-        }
         features_enabled = [
-            names for names, en in features.items() if en
+            names for names, bit, active_high in zip(
+                self.FEATURE_NAMES,
+                self.FEATURE_BITS,
+                self.FEATURE_ACTIVE_HIGH,
+            )
+            if bool(value & bit) == active_high
         ]
 
         return channels_enabled, features_enabled
 
-    def get_adc_channel(self, frame1) -> int:
-        """ Returns the ADC channel in use for a returned measurement.
-
-        Uses READ frame #1 (zero-indexed)
-        """
-        return (frame1 >> 4) & 0b11
-
-    def get_adc_value(self, frame1, frame2) -> int:
-        """ Returns the ADC value for a measurement.
-
-        Uses READ frames #1 and #2 (zero-indexed)
-        """
-        # The AD799x series left-justifies their ADC results,
-        # so the second frame's rightmost bits may be empty
-        # on devices with lesser capabilities.  The below two
-        # shifts shift the contents of the first frame to the
-        # left and the second to the right such that when added together
-        # the rightmost bit provided by the ADC (in the second frame) is
-        # in the 1s position, and the rightmost bit of the first frame
-        # is one bit to the left of the leftmost bit of the second.
-        frame_one_left_shift = self._bits - 4
-        frame_two_right_shift = 0 - (self._bits - 12)
-
-        msb = ((frame1 & 0b1111) << frame_one_left_shift)
-        lsb = frame2 >> frame_two_right_shift
-
-        return msb + lsb
-
     def get_adc_voltage(self, value):
-        if not self._reference_voltage:
+        if self._lsb_voltage is None:
             return None
 
-        return (value / (2**self._bits)) * self._reference_voltage
+        return value * self._lsb_voltage
 
     def get_displayable_adc_value(self, value):
-        if not self._reference_voltage:
+        if self._lsb_voltage is None:
             return [str(value)]
 
-        voltage = (value / (2**self._bits)) * self._reference_voltage
+        return list(_format_adc_value(value, self._lsb_voltage))
+
+    def _bubble_write_address(self, packet_id, value):
+        return list(self.WRITE_ADDRESS_LABELS)
+
+    def _bubble_write_configuration(self, packet_id, value):
+        ch_enabled, feat_enabled = self.get_configuration_settings(value)
+
+        channels_long = ', '.join(ch_enabled)
+        channels_short = '/'.join(ch_enabled)
+        features_long = ', '.join(f[0] for f in feat_enabled)
+        features_short = '/'.join(f[1] for f in feat_enabled)
+        features_bin = bin(value & 0b1111)
 
         return [
-            "{voltage:.4f} V ({raw})".format(
-                voltage=voltage,
-                raw=value,
-            ),
-            "{voltage:.4f} V".format(
-                voltage=voltage,
-                raw=value,
-            ),
-            "{voltage:.2f}".format(
-                voltage=voltage,
-                raw=value,
-            )
+            f'Channels: {channels_long}; Features: {features_long}',
+            f'Ch: {channels_short}; Feat: {features_short}',
+            f'Ch: {channels_short}; Feat: {features_bin}',
+            f'Ch: {channels_short}',
+            channels_short,
+            bin(value)
+        ]
+
+    def _bubble_read_address(self, packet_id, value):
+        return list(self.READ_ADDRESS_LABELS)
+
+    def _bubble_read_channel(self, packet_id, value):
+        channel = _adc_channel(value)
+
+        return [
+            f"Channel: {channel}",
+            f"Ch: {channel}",
+            channel,
+        ]
+
+    def _bubble_read_value(self, packet_id, value):
+        frame_one = self.get_packet_nth_frame(packet_id, 1)
+
+        adc_result = _adc_value(
+            frame_one.value,
+            value,
+            self._msb_shift,
+            self._lsb_shift,
+        )
+
+        return self.get_displayable_adc_value(adc_result)
+
+    def _bubble_unknown(self, packet_id, value):
+        return [
+            bin(value)
         ]
 
+    # Names of the bubble text handlers keyed by
+    # (is_read, position of frame in packet)
+    BUBBLE_HANDLERS = {
+        (False, 0): '_bubble_write_address',
+        (False, 1): '_bubble_write_configuration',
+        (True, 0): '_bubble_read_address',
+        (True, 1): '_bubble_read_channel',
+        (True, 2): '_bubble_read_value',
+    }
+
     def handle_bubble(
         self,
         packet_id: Optional[int],
@@ -145,95 +263,21 @@ class AD7995Analyzer(I2CAnalyzer):
         direction: Channel,
         value: int
     ) -> List[str]:
-        if not self.packet_address_matches(packet_id):
+        matches, is_read = self.get_packet_address_info(packet_id)
+        if not matches:
             return []
 
-        address_frame = self.get_packet_nth_frame(packet_id, 0)
-        is_read = address_frame['value'] & 0b1
-        is_write = not is_read
-        if (
-            (
-                not self.get_packet_length(packet_id) == 2
-                and is_write
-            )
-            or
-            (
-                not self.get_packet_length(packet_id) == 3
-                and is_read
-            )
-        ):
+        if self.get_packet_length(packet_id) != (3 if is_read else 2):
             # We don't have quite enough data to do anything
             return []
 
         frame_index = self.get_packet_frame_index(packet_id, frame_index)
 
-        if is_write:
-            if frame_index == 0:
-                return [
-                    "Write to ADC Configuration",
-                    "W to ADC",
-                    "W",
-                ]
-            elif frame_index == 1:
-                ch_enabled, feat_enabled = self.get_configuration_settings(
-                    value
-                )
-
-                return [
-                    (
-                        'Channels: {channels}; Features: {features}'.format(
-                            channels=', '.join(ch_enabled),
-                            features=', '.join(f[0] for f in feat_enabled),
-                        )
-                    ),
-                    (
-                        'Ch: {channels}; Feat: {features}'.format(
-                            channels='/'.join(ch_enabled),
-                            features='/'.join(f[1] for f in feat_enabled),
-                        )
-                    ),
-                    (
-                        'Ch: {channels}; Feat: {features}'.format(
-                            channels='/'.join(ch_enabled),
-                            features=bin(value & 0b1111)
-                        )
-                    ),
-                    (
-                        'Ch: {channels}'.format(
-                            channels='/'.join(ch_enabled),
-                        )
-                    ),
-                    (
-                        '{channels}'.format(
-                            channels='/'.join(ch_enabled),
-                        )
-                    ),
-                    bin(value)
-                ]
-        else:
-            if frame_index == 0:
-                return [
-                    "Read ADC Value",
-                    "R from ADC",
-                    "R",
-                ]
-            elif frame_index == 1:
-                channel = self.get_adc_channel(value)
-
-                return [
-                    "Channel: {ch}".format(ch=channel),
-                    "Ch: {ch}".format(ch=channel),
-                    channel,
-                ]
-            elif frame_index == 2:
-                frame_one = self.get_packet_nth_frame(packet_id, 1)
-
-                adc_result = self.get_adc_value(frame_one['value'], value)
-
-                return self.get_displayable_adc_value(adc_result)
-        return [
-            bin(value)
-        ]
+        handler_name = self.BUBBLE_HANDLERS.get(
+            (is_read, frame_index),
+            '_bubble_unknown',
+        )
+        return getattr(self, handler_name)(packet_id, value)
 
     def handle_tabular(
         self,
@@ -248,62 +292,45 @@ class AD7995Analyzer(I2CAnalyzer):
     ) -> List[str]:
         no_result = [' ']  # Saleae requires that we return _something_
 
-        if not self.packet_address_matches(packet_id):
+        matches, is_read = self.get_packet_address_info(packet_id)
+        if not matches:
             return no_result
 
-        address_frame = self.get_packet_nth_frame(packet_id, 0)
-        is_read = address_frame['value'] & 0b1
-        is_write = not is_read
-        if (
-            (
-                not self.get_packet_length(packet_id) == 2
-                and is_write
-            )
-            or
-            (
-                not self.get_packet_length(packet_id) == 3
-                and is_read
-            )
-        ):
+        if self.get_packet_length(packet_id) != (3 if is_read else 2):
             # We don't have quite enough data to do anything
             return no_result
 
         if self.get_packet_frame_index(packet_id, frame_index) != 1:
             return no_result
 
-        if is_write:
+        if not is_read:
             configuration_frame = self.get_packet_nth_frame(packet_id, 1)
             ch_enabled, feat_enabled = self.get_configuration_settings(
-                configuration_frame['value']
+                configuration_frame.value
             )
 
+            channels_long = ', '.join(ch_enabled)
+            features_long = ', '.join(f[0] for f in feat_enabled)
+
             return [
-                '[ADC config] Channels enabled: {chan}; '
-                'Features enabled: {feat}'.format(
-                    chan=', '.join(ch_enabled),
-                    feat=', '.join(f[0] for f in feat_enabled)
-                )
+                f'[ADC config] Channels enabled: {channels_long}; '
+                f'Features enabled: {features_long}'
             ]
-        elif is_read:
+        else:
             frame_one = self.get_packet_nth_frame(packet_id, 1)
             frame_two = self.get_packet_nth_frame(packet_id, 2)
 
-            channel = self.get_adc_channel(frame_one['value'])
-            adc_result = self.get_adc_value(
-                frame_one['value'],
-                frame_two['value'],
+            channel = _adc_channel(frame_one.value)
+            adc_result = _adc_value(
+                frame_one.value,
+                frame_two.value,
+                self._msb_shift,
+                self._lsb_shift,
             )
 
-            return [
-                '[ADC read] channel {chan}: {value}'.format(
-                    chan=channel,
-                    value=self.get_displayable_adc_value(
-                        adc_result
-                    )[0]
-                )
-            ]
+            displayable = self.get_displayable_adc_value(adc_result)[0]
 
-        return no_result
+            return [f'[ADC read] channel {channel}: {displayable}']
 
 
 if __name__ == '__main__':
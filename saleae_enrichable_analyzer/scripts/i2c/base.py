@@ -1,5 +1,8 @@
+import argparse
+import bisect
+import collections
 import logging
-from typing import Optional
+from typing import NamedTuple, Optional, Tuple
 
 from saleae_enrichable_analyzer import EnrichableAnalyzer
 
@@ -7,11 +10,49 @@ from saleae_enrichable_analyzer import EnrichableAnalyzer
 logger = logging.getLogger(__name__)
 
 
+def _positive_int(value: str) -> int:
+    parsed = int(value)
+    if parsed < 1:
+        raise argparse.ArgumentTypeError(
+            f"must be a positive integer; got {value}"
+        )
+
+    return parsed
+
+
+class _Frame(NamedTuple):
+    frame_index: int
+    frame_type: int
+    flags: int
+    value: int
+
+
+class _PacketMeta(object):
+    """ Derived state for a packet, updated as its frames are stored. """
+    __slots__ = ('address_value', 'length', 'frame_order')
+
+    def __init__(self):
+        self.address_value = None
+        self.length = 0
+        self.frame_order = []
+
+
 class I2CAnalyzer(EnrichableAnalyzer):
-    def __init__(self, *args, **kwargs):
-        super(I2CAnalyzer, self).__init__(*args, **kwargs)
+    def __init__(self, cli_args, *args, **kwargs):
+        super(I2CAnalyzer, self).__init__(cli_args, *args, **kwargs)
 
-        self._packets = {}
+        self._address = cli_args.i2c_address
+        # The address as it appears on the wire: shifted left to make
+        # room for the R/W bit.
+        self._address_byte = self._address << 1
+
+        # Saleae sends every marker up-front, but asks for bubble and
+        # tabular text only once a region is drawn -- so by default we
+        # must keep every packet we've seen.
+        self._max_stored_packets = cli_args.max_stored_packets
+
+        self._packets = collections.OrderedDict()
+        self._packet_meta = collections.OrderedDict()
 
     @classmethod
     def add_arguments(cls, parser):
@@ -21,6 +62,19 @@ class I2CAnalyzer(EnrichableAnalyzer):
             help='The device\'s I2C address as a base-2 integer.',
             type=lambda x: int(x, base=2),
         )
+        parser.add_argument(
+            '--max-stored-packets',
+            help=(
+                'Limit the number of packets kept in memory; the oldest '
+                'packets are discarded first.  Packets that have been '
+                'discarded will no longer be decoded if Saleae Logic '
+                'asks to display them, so only set this if memory use '
+                'on very long captures is a problem.  Must be at least '
+                '1; unlimited by default.'
+            ),
+            type=_positive_int,
+            default=None,
+        )
 
     def store_frame(
         self,
@@ -30,38 +84,61 @@ class I2CAnalyzer(EnrichableAnalyzer):
         flags,
         value,
     ):
-        if packet_id not in self._packets:
-            self._packets[packet_id] = []
-
-        if not any(
-            f['frame_index'] == frame_index for f in self._packets[packet_id]
-        ):
-            self._packets[packet_id].append({
-                'frame_index': frame_index,
-                'frame_type': frame_type,
-                'flags': flags,
-                'value': value,
-            })
+        frames = self._packets.get(packet_id)
+        if frames is None:
+            # Make room before storing the new packet so that it is
+            # never itself the packet discarded.
+            if self._max_stored_packets is not None:
+                while (
+                    self._packets
+                    and len(self._packets) >= self._max_stored_packets
+                ):
+                    evicted_packet_id, _ = self._packets.popitem(last=False)
+                    del self._packet_meta[evicted_packet_id]
+                    logger.debug(
+                        "Discarded stored frames for packet %#x",
+                        evicted_packet_id
+                    )
+
+            frames = self._packets[packet_id] = {}
+            self._packet_meta[packet_id] = _PacketMeta()
+        elif frame_index in frames:
+            return
+
+        frames[frame_index] = _Frame(frame_index, frame_type, flags, value)
+
+        meta = self._packet_meta[packet_id]
+        bisect.insort(meta.frame_order, frame_index)
+        meta.length += 1
+
+        # The address frame is always the earliest frame of the packet
+        if meta.frame_order[0] == frame_index:
+            meta.address_value = value
 
     def get_packet_frames(self, packet_id):
-        return sorted(
-            self._packets.get(packet_id, []),
-            key=lambda f: f['frame_index'],
-        )
+        meta = self._packet_meta.get(packet_id)
+        if meta is None:
+            return []
+
+        frames = self._packets[packet_id]
+        return [frames[frame_index] for frame_index in meta.frame_order]
 
     def get_packet_length(self, packet_id):
-        return len(self._packets[packet_id])
+        return self._packet_meta[packet_id].length
 
     def get_packet_frame_index(self, packet_id, frame_index):
-        return list(
-            map(
-                lambda frame: frame['frame_index'],
-                self.get_packet_frames(packet_id)
+        frame_order = self._packet_meta[packet_id].frame_order
+        idx = bisect.bisect_left(frame_order, frame_index)
+        if idx == len(frame_order) or frame_order[idx] != frame_index:
+            raise ValueError(
+                f"Frame {frame_index} is not part of packet {packet_id}"
             )
-        ).index(frame_index)
+
+        return idx
 
     def get_packet_nth_frame(self, packet_id, idx):
-        return self.get_packet_frames(packet_id)[idx]
+        frame_index = self._packet_meta[packet_id].frame_order[idx]
+        return self._packets[packet_id][frame_index]
 
     def handle_marker(
         self,
@@ -88,18 +165,29 @@ class I2CAnalyzer(EnrichableAnalyzer):
 
         return []
 
-    def packet_address_matches(self, packet_id: Optional[int]):
-        try:
-            address_frame = self.get_packet_nth_frame(packet_id, 0)
-        except IndexError:
+    def get_packet_address_info(
+        self,
+        packet_id: Optional[int]
+    ) -> Tuple[bool, bool]:
+        """ Returns whether a packet is addressed to our device.
+
+        Also returns whether the packet is a read, since that is
+        encoded in the same address byte.
+        """
+        meta = self._packet_meta.get(packet_id)
+        if meta is None:
             logger.debug(
-                "Could not find address frame for packet %s",
-                hex(packet_id)
+                "Could not find address frame for packet %#x",
+                packet_id
             )
-            return False
+            return False, False
 
-        if(address_frame['value'] >> 1 != self._address):
-            # This isn't our device
-            return False
+        address_value = meta.address_value
+        return (
+            (address_value & 0xFE) == self._address_byte,
+            bool(address_value & 0b1),
+        )
 
-        return True
+    def packet_address_matches(self, packet_id: Optional[int]) -> bool:
+        matches, _ = self.get_packet_address_info(packet_id)
+        return matches
@@ -1,4 +1,4 @@
-from setuptools import setup, find_packages
+from setuptools import setup
 from os import path
 
 here = path.abspath(path.dirname(__file__))
@@ -22,5 +22,10 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
     ],
-    packages=find_packages()
+    packages=[
+        'saleae_enrichable_analyzer',
+        'saleae_enrichable_analyzer.scripts',
+        'saleae_enrichable_analyzer.scripts.i2c',
+        'saleae_enrichable_analyzer.scripts.spi',
+    ]
 )